@@ -1,6 +1,7 @@
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, request, jsonify, send_file, Response
 from flask_cors import CORS
-from pymongo import MongoClient
+from pymongo import MongoClient, UpdateOne
+from pymongo.errors import BulkWriteError
 from PIL import Image
 import io
 import os
@@ -16,6 +17,9 @@ from dotenv import load_dotenv
 from functools import wraps
 import requests
 import time
+import zipfile
+import itertools
+import threading
 
 # Load environment variables
 load_dotenv()
@@ -27,7 +31,8 @@ CORS(app, resources={
     r"/api/*": {
         "origins": ["http://localhost:3000"],
         "methods": ["GET", "POST", "DELETE", "OPTIONS"],
-        "allow_headers": ["Content-Type", "Authorization"]
+        "allow_headers": ["Content-Type", "Authorization"],
+        "expose_headers": ["X-Duplicate-Of"]
     }
 })
 
@@ -230,6 +235,184 @@ def convert_to_black_white_sketch(image_bytes: bytes) -> np.ndarray:
         traceback.print_exc()
         raise
 
+# Perceptual hashing settings; distances are Hamming distances between 64-bit hashes
+# Measured on synthetic line drawings: rescans, specks, shadows and margin crops land
+# within 8 bits, while distinct sketches stayed at least 12 bits apart
+NEAR_DUPLICATE_DISTANCE = int(os.getenv('NEAR_DUPLICATE_DISTANCE', '10'))
+HASH_MAX_SIDE = 512
+SIMILAR_DESIGNS_DISTANCE = int(os.getenv('SIMILAR_DESIGNS_DISTANCE', '12'))
+MAX_SIMILAR_DESIGNS_DISTANCE = 16
+MAX_SIMILAR_RESULTS = 50
+
+def compute_phash(image_bytes):
+    """Compute a 64-bit DCT perceptual hash of an image, returned as a hex string"""
+    nparr = np.frombuffer(image_bytes, np.uint8)
+    image = cv2.imdecode(nparr, cv2.IMREAD_GRAYSCALE)
+    if image is None:
+        raise ValueError("Failed to decode image from bytes")
+
+    # Work at a bounded size; the hash only keeps 32x32 worth of detail anyway
+    scale = HASH_MAX_SIDE / max(image.shape)
+    if scale < 1:
+        image = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+    # Divide out the paper background so shadows and uneven lighting do not read as ink
+    kernel_size = max(15, (min(image.shape) // 16) | 1)
+    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (kernel_size, kernel_size))
+    background = cv2.morphologyEx(image, cv2.MORPH_CLOSE, kernel)
+    image = cv2.divide(image, background, scale=255)
+
+    # Hash only the drawn content so trimming the paper margin does not change the hash.
+    # Dust specks are dropped by area and stray marks by taking percentile bounds.
+    _, ink = cv2.threshold(image, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+    count, labels, stats, _ = cv2.connectedComponentsWithStats(ink, connectivity=8)
+    keep = np.zeros(count, dtype=bool)
+    keep[1:] = stats[1:, cv2.CC_STAT_AREA] >= max(16, image.size // 10000)
+    ys, xs = np.nonzero(keep[labels])
+    if len(xs):
+        x0, x1 = np.percentile(xs, [1, 99]).astype(int)
+        y0, y1 = np.percentile(ys, [1, 99]).astype(int)
+        image = image[y0:y1 + 1, x0:x1 + 1]
+
+        # Pad to a square so a stretched copy does not hash like the original
+        height, width = image.shape
+        side = max(height, width)
+        image = cv2.copyMakeBorder(
+            image,
+            (side - height) // 2, side - height - (side - height) // 2,
+            (side - width) // 2, side - width - (side - width) // 2,
+            cv2.BORDER_CONSTANT, value=255
+        )
+
+    # Keep the lowest 8x8 frequencies of a 32x32 DCT and threshold on their median
+    resized = cv2.resize(image, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+    low_freq = cv2.dct(resized)[:8, :8].flatten()
+    median = np.median(low_freq[1:])  # Ignore the DC term, which only tracks brightness
+    bits = low_freq > median
+
+    value = 0
+    for bit in bits:
+        value = (value << 1) | int(bit)
+    return f"{value:016x}"
+
+def hamming_distance(hash_a, hash_b):
+    """Number of differing bits between two perceptual hashes"""
+    return bin(hash_a ^ hash_b).count('1')
+
+class BKTree:
+    """Burkhard-Keller tree over integer hashes using Hamming distance"""
+
+    def __init__(self):
+        self.root = None  # [hash, set of image ids, {distance: child node}]
+
+    def add(self, hash_value, image_id):
+        if self.root is None:
+            self.root = [hash_value, {image_id}, {}]
+            return
+
+        node = self.root
+        while True:
+            distance = hamming_distance(hash_value, node[0])
+            if distance == 0:
+                node[1].add(image_id)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [hash_value, {image_id}, {}]
+                return
+            node = child
+
+    def search(self, hash_value, max_distance):
+        """Return (distance, image_id) pairs within max_distance of hash_value"""
+        matches = []
+        if self.root is None:
+            return matches
+
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            distance = hamming_distance(hash_value, node[0])
+            if distance <= max_distance:
+                matches.extend((distance, image_id) for image_id in node[1])
+            # Triangle inequality: only subtrees in this band can hold matches
+            for child_distance, child in node[2].items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    stack.append(child)
+        return matches
+
+class SimilarityIndex:
+    """In-memory perceptual hash index with a global tree and one tree per user"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        self.entries = {}  # image_id -> (hash, userEmail, model_type)
+        self.global_tree = BKTree()
+        self.user_trees = {}
+        self.removed_count = 0
+
+    def add(self, image_id, phash, user_email, model_type):
+        hash_value = int(phash, 16)
+        with self._lock:
+            self.entries[image_id] = (hash_value, user_email, model_type)
+            self.global_tree.add(hash_value, image_id)
+            self.user_trees.setdefault(user_email, BKTree()).add(hash_value, image_id)
+
+    def get(self, image_id):
+        return self.entries.get(image_id)
+
+    def remove(self, image_ids, user_email):
+        """Drop entries owned by user_email; trees are rebuilt once removals pile up"""
+        with self._lock:
+            for image_id in image_ids:
+                entry = self.entries.get(image_id)
+                if entry is not None and entry[1] == user_email:
+                    del self.entries[image_id]
+                    self.removed_count += 1
+            if self.removed_count > len(self.entries):
+                self._rebuild()
+
+    def _rebuild(self):
+        entries = self.entries
+        self.global_tree = BKTree()
+        self.user_trees = {}
+        for image_id, (hash_value, user_email, _) in entries.items():
+            self.global_tree.add(hash_value, image_id)
+            self.user_trees.setdefault(user_email, BKTree()).add(hash_value, image_id)
+        self.removed_count = 0
+
+    def search(self, phash, max_distance, user_email=None, model_type=None, limit=None):
+        """Find stored designs near phash, scoped to one user when user_email is given"""
+        hash_value = int(phash, 16) if isinstance(phash, str) else phash
+        with self._lock:
+            tree = self.user_trees.get(user_email) if user_email else self.global_tree
+            if tree is None:
+                return []
+            matches = []
+            for distance, image_id in tree.search(hash_value, max_distance):
+                entry = self.entries.get(image_id)
+                if entry is None:
+                    continue  # Deleted since the tree was last rebuilt
+                if model_type is not None and entry[2] != model_type:
+                    continue
+                matches.append((distance, image_id))
+        matches.sort()
+        return matches[:limit] if limit else matches
+
+similarity_index = SimilarityIndex()
+
+def find_near_duplicate(phash, user_email, model_type):
+    """Return the stored design this upload duplicates, or None"""
+    if collection is None:
+        return None
+    for _, image_id in similarity_index.search(phash, NEAR_DUPLICATE_DISTANCE, user_email, model_type):
+        image_doc = collection.find_one({"_id": image_id}, {"generated_image": 1})
+        if image_doc:
+            return image_doc
+    return None
+
 def process_image_request(request, model_type):
     """Common image processing logic for all endpoints with improved error handling"""
     try:
@@ -245,6 +428,24 @@ def process_image_request(request, model_type):
         image_bytes = file.read()
         print(f"Processing image for email: {email}, size: {len(image_bytes)} bytes")
 
+        # Step 0: Serve a stored design when this upload is a near-duplicate of one
+        try:
+            phash = compute_phash(image_bytes)
+        except Exception as e:
+            print(f"Error computing perceptual hash: {str(e)}")
+            phash = None
+        if phash is not None:
+            duplicate = find_near_duplicate(phash, email, model_type)
+            if duplicate is not None:
+                print(f"Upload is a near-duplicate of image {duplicate['_id']}, skipping generation")
+                response = send_file(
+                    io.BytesIO(base64.b64decode(duplicate['generated_image'])),
+                    mimetype='image/png',
+                    as_attachment=False
+                )
+                response.headers['X-Duplicate-Of'] = str(duplicate['_id'])
+                return response
+
         # Step 1: Classify the image (primary validation)
         is_valid_sketch, confidence = classify_image(image_bytes)
         if not is_valid_sketch and confidence > 0:  # Only reject if we have a confident negative classification
@@ -303,7 +504,7 @@ def process_image_request(request, model_type):
             
             # Save to database
             try:
-                image_id = save_to_database(sketch_image_b64, generated_image_b64, model_type, email)
+                image_id = save_to_database(sketch_image_b64, generated_image_b64, model_type, email, phash)
                 print(f"Successfully saved images to database with ID: {image_id}")
             except Exception as e:
                 print(f"Error saving to database: {str(e)}")
@@ -332,28 +533,118 @@ def process_image_request(request, model_type):
         print(f"Unexpected error: {str(e)}")
         return jsonify({"error": "An unexpected error occurred"}), 500
 
-def save_to_database(sketch_image_b64, generated_image_b64, model_type, user_email):
-    """Save processed images to database with user email"""
-    if collection is None:
-        raise Exception("Database connection not available")
-        
-    unique_id = str(uuid.uuid4())
+def prepare_model_input(image_bytes, model_type):
+    """Preprocess a single upload into a (1, 256, 256, 3) model input in [-1, 1]"""
+    if model_type == "paper_sketch":
+        sketch_image = convert_to_black_white_sketch(image_bytes)
+        return (sketch_image * 2) - 1  # Convert [0,1] to [-1,1]
+    return load_image_for_prediction(image_bytes)
+
+def process_batch_with_model(batch_array, model_type):
+    """Run a whole batch of preprocessed images through the model in one pass"""
+    if model_type not in models:
+        raise ValueError(f"Unknown model type: {model_type}")
+
+    model = models.get(model_type)
+    if model is None:
+        raise ValueError(f"Model {model_type} not loaded")
+
+    predicted_images = model(batch_array, training=False)
+    return (predicted_images + 1) / 2  # Convert [-1,1] back to [0,1]
+
+def classify_images(images_bytes):
+    """Classify a list of images in a single classifier pass
+
+    Returns one (is_valid, confidence) pair per image, or None for images that
+    could not be decoded so callers can reject just those files.
+    """
+    decoded = []
+    for image_bytes in images_bytes:
+        try:
+            image = Image.open(io.BytesIO(image_bytes)).convert('RGB').resize((150, 150))
+            decoded.append(np.array(image) / 255.0)
+        except Exception as e:
+            print(f"Error decoding image for classification: {str(e)}")
+            decoded.append(None)
+
+    results = [None if image_array is None else (True, 0.0) for image_array in decoded]
+    valid_indices = [index for index, image_array in enumerate(decoded) if image_array is not None]
+
+    classifier = models.get('classifier')
+    if classifier is None:
+        print("Classifier model not loaded")
+        return results  # Continue without classification if model not loaded
+    if not valid_indices:
+        return results
+
+    try:
+        predictions = classifier.predict(np.stack([decoded[index] for index in valid_indices]), verbose=0)
+        for index, prediction in zip(valid_indices, predictions):
+            confidence = float(prediction[0])
+            results[index] = (confidence > 0.5, confidence)
+    except Exception as e:
+        print(f"Error in batch classification: {str(e)}")
+    return results
+
+def build_record(sketch_image_b64, generated_image_b64, model_type, user_email, phash=None):
+    """Build a designs record ready for insertion"""
+    now = datetime.datetime.utcnow()
     record = {
-        "_id": unique_id,
+        "_id": str(uuid.uuid4()),
         "userEmail": user_email,
         "sketch_image": sketch_image_b64,
         "generated_image": generated_image_b64,
         "model_type": model_type,
-        "timestamp": datetime.datetime.utcnow(),
-        "filename": f"{user_email}_{datetime.datetime.utcnow().strftime('%Y%m%d_%H%M%S')}"
+        "timestamp": now,
+        "filename": f"{user_email}_{now.strftime('%Y%m%d_%H%M%S')}"
     }
+    if phash is not None:
+        record["phash"] = phash
+    return record
+
+def index_record(record):
+    """Add a saved record to the in-memory similarity index"""
+    if record.get("phash"):
+        similarity_index.add(record["_id"], record["phash"], record["userEmail"], record["model_type"])
+
+def save_to_database(sketch_image_b64, generated_image_b64, model_type, user_email, phash=None):
+    """Save processed images to database with user email"""
+    if collection is None:
+        raise Exception("Database connection not available")
+        
+    record = build_record(sketch_image_b64, generated_image_b64, model_type, user_email, phash)
     collection.insert_one(record)
-    return unique_id
+    index_record(record)
+    return record["_id"]
+
+def save_many_to_database(records):
+    """Save several design records in a single round trip
+
+    Returns the ids that were actually inserted; with an unordered insert some
+    records can fail while the rest are still saved.
+    """
+    if not records:
+        return []
+    if collection is None:
+        raise Exception("Database connection not available")
+
+    failed_indices = set()
+    try:
+        collection.insert_many(records, ordered=False)
+    except BulkWriteError as e:
+        failed_indices = {error["index"] for error in e.details.get("writeErrors", [])}
+        print(f"Failed to save {len(failed_indices)} of {len(records)} records: {str(e)}")
+
+    saved_records = [record for index, record in enumerate(records) if index not in failed_indices]
+    for record in saved_records:
+        index_record(record)
+    return [record["_id"] for record in saved_records]
 
 # MongoDB configuration with error handling
 MONGO_URI = os.getenv('MONGO_URI', 'mongodb://localhost:27017/')
 DB_NAME = os.getenv('DB_NAME', 'jewelry_website')
 COLLECTION_NAME = 'designs'
+BACKFILL_CHUNK_SIZE = 500
 
 def init_mongodb():
     """Initialize MongoDB connection with error handling"""
@@ -379,6 +670,42 @@ def init_mongodb():
         collection = None
         return False
 
+def build_similarity_index():
+    """Load stored perceptual hashes into memory, backfilling records that lack one"""
+    if collection is None:
+        return False
+
+    similarity_index.clear()
+
+    # Records saved before hashing existed: hash their sketches and write back in chunks
+    backfilled = 0
+    updates = []
+    legacy_records = collection.find(
+        {"phash": {"$exists": False}},
+        {"userEmail": 1, "model_type": 1, "sketch_image": 1}
+    )
+    for record in legacy_records:
+        try:
+            phash = compute_phash(base64.b64decode(record["sketch_image"]))
+        except Exception as e:
+            print(f"Could not hash image {record['_id']}: {str(e)}")
+            continue
+        updates.append(UpdateOne({"_id": record["_id"]}, {"$set": {"phash": phash}}))
+        similarity_index.add(record["_id"], phash, record.get("userEmail"), record.get("model_type"))
+        if len(updates) >= BACKFILL_CHUNK_SIZE:
+            backfilled += collection.bulk_write(updates, ordered=False).modified_count
+            updates = []
+    if updates:
+        backfilled += collection.bulk_write(updates, ordered=False).modified_count
+
+    # Everything else only needs its hash, never the image payloads
+    for record in collection.find({"phash": {"$exists": True}}, {"userEmail": 1, "model_type": 1, "phash": 1}):
+        if record["_id"] not in similarity_index.entries:
+            similarity_index.add(record["_id"], record["phash"], record.get("userEmail"), record.get("model_type"))
+
+    print(f"Indexed {len(similarity_index.entries)} designs for similarity search ({backfilled} backfilled)")
+    return True
+
 @app.route('/api/upload', methods=['POST'])
 def process_gold():
     """Endpoint for gold jewelry model"""
@@ -399,6 +726,195 @@ def process_paper_sketch():
     """Endpoint for paper sketch model"""
     return process_image_request(request, "paper_sketch")
 
+# Bulk operation limits and the upload slugs accepted by /api/upload/batch
+MAX_BATCH_FILES = int(os.getenv('MAX_BATCH_FILES', '16'))
+MAX_BATCH_IDS = int(os.getenv('MAX_BATCH_IDS', '100'))
+BATCH_MODEL_TYPES = {
+    "gold": "gold",
+    "silver": "silver",
+    "gold-gemstone": "gold_gemstone",
+    "paper-sketch": "paper_sketch"
+}
+
+@app.route('/api/upload/batch', methods=['POST'])
+def process_batch_upload():
+    """Endpoint for uploading several sketches through one batched model pass"""
+    try:
+        files = request.files.getlist('files')
+        if not files:
+            return jsonify({"error": "No files provided"}), 400
+        if len(files) > MAX_BATCH_FILES:
+            return jsonify({"error": f"At most {MAX_BATCH_FILES} files can be uploaded at once"}), 400
+
+        email = request.form.get('email') or request.form.get('userEmail')
+        if not email:
+            return jsonify({"error": "Email not provided"}), 400
+
+        model_type = BATCH_MODEL_TYPES.get(request.form.get('model', 'gold'))
+        if model_type is None:
+            return jsonify({"error": f"Unknown model: {request.form.get('model')}"}), 400
+        # Fail before any captioning calls are spent on a batch that cannot be generated
+        if models.get(model_type) is None:
+            return jsonify({"error": f"Model {model_type} not loaded"}), 500
+
+        uploads = [(file.filename, file.read()) for file in files]
+        print(f"Processing batch of {len(uploads)} images for email: {email}")
+
+        # Step 0: Answer near-duplicates of stored designs without generating them again
+        results = [None] * len(uploads)
+        phashes = [None] * len(uploads)
+        duplicate_of = {}
+        # Rescans within this batch reuse the result of the first copy instead of being generated
+        batch_tree = BKTree()
+        batch_duplicate_of = {}
+        for index, (filename, image_bytes) in enumerate(uploads):
+            try:
+                phashes[index] = compute_phash(image_bytes)
+            except Exception as e:
+                print(f"Error computing perceptual hash for {filename}: {str(e)}")
+                continue
+            matches = similarity_index.search(phashes[index], NEAR_DUPLICATE_DISTANCE, email, model_type, limit=1)
+            if matches:
+                duplicate_of[index] = matches[0][1]
+                continue
+            batch_matches = batch_tree.search(int(phashes[index], 16), NEAR_DUPLICATE_DISTANCE)
+            if batch_matches:
+                batch_duplicate_of[index] = min(batch_matches)[1]
+            else:
+                batch_tree.add(int(phashes[index], 16), index)
+
+        if duplicate_of and collection is not None:
+            duplicates = {
+                image_doc["_id"]: image_doc["generated_image"]
+                for image_doc in collection.find(
+                    {"_id": {"$in": list(set(duplicate_of.values()))}},
+                    {"generated_image": 1}
+                )
+            }
+            for index, image_id in duplicate_of.items():
+                if image_id in duplicates:
+                    results[index] = {
+                        "filename": uploads[index][0],
+                        "id": image_id,
+                        "duplicate_of": image_id,
+                        "generated_image": duplicates[image_id]
+                    }
+
+        # Step 1: Validate every remaining image, collecting rejections instead of failing the batch
+        pending = [
+            index for index in range(len(uploads))
+            if results[index] is None and index not in batch_duplicate_of
+        ]
+        accepted = []
+        classifications = classify_images([uploads[index][1] for index in pending])
+        for index, classification in zip(pending, classifications):
+            filename, image_bytes = uploads[index]
+            if classification is None:
+                results[index] = {"filename": filename, "error": "The file could not be read as an image"}
+                continue
+            is_valid_sketch, confidence = classification
+            if not is_valid_sketch and confidence > 0:
+                results[index] = {
+                    "filename": filename,
+                    "error": "The image does not appear to be a valid sketch",
+                    "confidence": confidence
+                }
+                continue
+
+            try:
+                result = query_huggingface_api(image_bytes)
+                if not (isinstance(result, list) and len(result) > 0 and isinstance(result[0], dict)):
+                    results[index] = {"filename": filename, "error": "Invalid response from captioning API"}
+                    continue
+                caption = str(result[0].get("generated_text", "No caption generated."))
+            except Exception as e:
+                print(f"Error captioning {filename}: {str(e)}")
+                results[index] = {"filename": filename, "error": "Captioning API request failed"}
+                continue
+            if is_jewelry(caption):
+                results[index] = {
+                    "filename": filename,
+                    "error": "The image does not appear to be jewelry-related",
+                    "caption": caption
+                }
+                continue
+
+            try:
+                accepted.append((index, prepare_model_input(image_bytes, model_type)))
+            except Exception as e:
+                results[index] = {"filename": filename, "error": str(e)}
+
+        # Step 2: Run all accepted images through the model in a single pass
+        records = []
+        if accepted:
+            try:
+                batch_array = np.concatenate([model_input for _, model_input in accepted], axis=0)
+                predicted_images = process_batch_with_model(batch_array, model_type)
+            except tf.errors.ResourceExhaustedError:
+                print("TensorFlow resource exhausted - suggesting retry")
+                return jsonify({
+                    "error": "Model resources exhausted. Please try again in a few minutes.",
+                    "retry_suggested": True
+                }), 503
+            except Exception as e:
+                print(f"Error in batch image processing: {str(e)}")
+                return jsonify({"error": str(e)}), 500
+
+            for (index, _), predicted_image in zip(accepted, predicted_images):
+                filename, image_bytes = uploads[index]
+                generated_pil = Image.fromarray((predicted_image * 255).numpy().astype(np.uint8))
+                img_byte_arr = io.BytesIO()
+                generated_pil.save(img_byte_arr, format='PNG')
+                generated_image_b64 = base64.b64encode(img_byte_arr.getvalue()).decode('utf-8')
+
+                record = build_record(base64.b64encode(image_bytes).decode('utf-8'), generated_image_b64, model_type, email, phashes[index])
+                records.append(record)
+                results[index] = {
+                    "filename": filename,
+                    "id": record["_id"],
+                    "generated_image": generated_image_b64
+                }
+
+        # Step 3: Save every generated design in one round trip
+        saved_ids = set()
+        try:
+            saved_ids = set(save_many_to_database(records))
+            print(f"Successfully saved {len(saved_ids)} of {len(records)} images to database")
+        except Exception as e:
+            print(f"Error saving batch to database: {str(e)}")
+        # Continue even if save fails, to at least return the generated images;
+        # only ids of records that were actually stored are reported
+        for result in results:
+            if result is None or "duplicate_of" in result:
+                continue
+            if result.get("id") not in saved_ids:
+                result.pop("id", None)
+
+        for index, original_index in batch_duplicate_of.items():
+            original = results[original_index]
+            if "generated_image" in original:
+                results[index] = {
+                    "filename": uploads[index][0],
+                    "id": original.get("id"),
+                    "duplicate_of": original.get("id"),
+                    "generated_image": original["generated_image"]
+                }
+            else:
+                # The first copy was rejected, so this rescan shares its outcome
+                results[index] = dict(original, filename=uploads[index][0])
+
+        duplicate_count = sum(1 for result in results if "duplicate_of" in result)
+        return jsonify({
+            "processed": len(records),
+            "duplicates": duplicate_count,
+            "failed": len(uploads) - len(records) - duplicate_count,
+            "results": results
+        })
+
+    except Exception as e:
+        print(f"Unexpected error in batch upload: {str(e)}")
+        return jsonify({"error": "An unexpected error occurred"}), 500
+
 @app.route('/api/images/my-images', methods=['GET'])
 def get_user_images():
     """Get processed images for a specific user"""
@@ -468,6 +984,74 @@ def download_image(image_id):
         print(f"Error downloading image: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/images/<image_id>/similar', methods=['GET'])
+def get_similar_images(image_id):
+    """Find designs perceptually similar to one of the user's images"""
+    try:
+        user_email = request.args.get('email') or request.args.get('userEmail')
+        if not user_email:
+            return jsonify({"error": "User email not provided"}), 400
+
+        entry = similarity_index.get(image_id)
+        if entry is None or entry[1] != user_email:
+            return jsonify({"error": "Image not found or unauthorized"}), 404
+
+        scope = request.args.get('scope', 'user')  # 'user' or 'global'
+        if scope not in ('user', 'global'):
+            return jsonify({"error": f"Unknown scope: {scope}"}), 400
+        max_distance = int(request.args.get('max_distance', SIMILAR_DESIGNS_DISTANCE))
+        max_distance = min(max(max_distance, 0), MAX_SIMILAR_DESIGNS_DISTANCE)
+        limit = int(request.args.get('limit', 20))
+        if not 1 <= limit <= MAX_SIMILAR_RESULTS:
+            return jsonify({"error": f"limit must be between 1 and {MAX_SIMILAR_RESULTS}"}), 400
+
+        matches = similarity_index.search(
+            entry[0],
+            max_distance,
+            user_email=user_email if scope == 'user' else None,
+            limit=limit + 1
+        )
+        matches = [(distance, match_id) for distance, match_id in matches if match_id != image_id][:limit]
+
+        if scope == 'global':
+            # Ids are only revealed for the caller's own designs; others are described
+            similar_designs = []
+            for distance, match_id in matches:
+                match = similarity_index.get(match_id)
+                if match is None:
+                    continue
+                similar_design = {"distance": distance, "model_type": match[2]}
+                if match[1] == user_email:
+                    similar_design["_id"] = match_id
+                similar_designs.append(similar_design)
+            return jsonify(similar_designs)
+
+        if collection is None:
+            return jsonify({"error": "Database connection not available"}), 500
+
+        images = {
+            image["_id"]: image
+            for image in collection.find({"_id": {"$in": [match_id for _, match_id in matches]}, "userEmail": user_email})
+        }
+        similar_images = []
+        for distance, match_id in matches:
+            image = images.get(match_id)
+            if image is None:
+                continue
+            image['_id'] = str(image['_id'])
+            if isinstance(image.get('timestamp'), datetime.datetime):
+                image['timestamp'] = image['timestamp'].isoformat()
+            image['distance'] = distance
+            similar_images.append(image)
+
+        return jsonify(similar_images)
+
+    except ValueError:
+        return jsonify({"error": "max_distance and limit must be integers"}), 400
+    except Exception as e:
+        print(f"Error finding similar images: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
 @app.route('/api/images/<image_id>', methods=['DELETE'])
 def delete_image(image_id):
     """Delete an image record from database"""
@@ -483,7 +1067,8 @@ def delete_image(image_id):
         if result.deleted_count == 0:
             print(f"Image {image_id} not found or unauthorized for user {user_email}")
             return jsonify({"error": "Image not found or unauthorized"}), 404
-            
+
+        similarity_index.remove([image_id], user_email)
         print(f"Successfully deleted image {image_id} for user {user_email}")
         return jsonify({"message": "Image deleted successfully"})
 
@@ -491,11 +1076,171 @@ def delete_image(image_id):
         print(f"Error deleting image: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+class ZipStreamBuffer(io.RawIOBase):
+    """Write-only sink that lets zipfile emit an archive chunk by chunk"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+def get_request_payload():
+    """Read the JSON body of a bulk request, or None when it is not a JSON object"""
+    payload = request.get_json(silent=True)
+    if payload is None:
+        return {}
+    return payload if isinstance(payload, dict) else None
+
+def get_request_email(payload):
+    """Read the owner's email from a JSON body or query args
+
+    Returns (email, error) where error is a message suitable for a 400 response.
+    Only plain strings are accepted so the value cannot act as a query operator.
+    """
+    user_email = payload.get('email') or request.args.get('email') or request.args.get('userEmail')
+    if not user_email:
+        return None, "User email not provided"
+    if not isinstance(user_email, str):
+        return None, "email must be a string"
+    return user_email, None
+
+def get_request_ids(payload):
+    """Read image ids from a JSON body or a comma separated `ids` query arg
+
+    Returns (ids, error) where error is a message suitable for a 400 response.
+    """
+    ids = payload.get('ids')
+    if ids is None:
+        ids = [image_id for image_id in request.args.get('ids', '').split(',') if image_id]
+    if not isinstance(ids, list) or not all(isinstance(image_id, str) for image_id in ids):
+        return None, "ids must be a list of strings"
+    if not ids:
+        return None, "No image ids provided"
+    if len(ids) > MAX_BATCH_IDS:
+        return None, f"At most {MAX_BATCH_IDS} images can be processed at once"
+    return ids, None
+
+@app.route('/api/images/batch/download', methods=['GET', 'POST'])
+def download_images_batch():
+    """Download several images as a ZIP archive streamed as it is built"""
+    try:
+        payload = get_request_payload()
+        if payload is None:
+            return jsonify({"error": "Request body must be a JSON object"}), 400
+
+        user_email, error = get_request_email(payload)
+        if error:
+            return jsonify({"error": error}), 400
+
+        image_ids, error = get_request_ids(payload)
+        if error:
+            return jsonify({"error": error}), 400
+
+        image_type = payload.get('type') or request.args.get('type', 'generated')
+        if image_type not in ('generated', 'sketch'):
+            return jsonify({"error": "type must be 'generated' or 'sketch'"}), 400
+        image_field = 'generated_image' if image_type == 'generated' else 'sketch_image'
+
+        if collection is None:
+            return jsonify({"error": "Database connection not available"}), 500
+
+        # One query for the whole archive; the cursor keeps only a small batch in memory
+        cursor = collection.find(
+            {"_id": {"$in": image_ids}, "userEmail": user_email, image_field: {"$exists": True}},
+            {"filename": 1, image_field: 1}
+        ).batch_size(8)
+
+        # Fetch the first document before streaming so a miss can still be a 404
+        first_doc = next(cursor, None)
+        if first_doc is None:
+            cursor.close()
+            return jsonify({"error": "Images not found or unauthorized"}), 404
+
+        def generate():
+            buffer = ZipStreamBuffer()
+            try:
+                with zipfile.ZipFile(buffer, mode='w', compression=zipfile.ZIP_STORED) as archive:
+                    for image_doc in itertools.chain([first_doc], cursor):
+                        try:
+                            image_bytes = base64.b64decode(image_doc[image_field])
+                        except Exception as e:
+                            # Headers are already sent, so skip the entry rather than abort the archive
+                            print(f"Skipping image {image_doc['_id']} in archive: {str(e)}")
+                            continue
+                        # PNGs are already compressed, so entries are stored as-is
+                        filename = f"{image_doc.get('filename', 'image')}_{str(image_doc['_id'])[:8]}_{image_type}.png"
+                        archive.writestr(filename, image_bytes)
+                        yield buffer.drain()
+                yield buffer.drain()
+            finally:
+                cursor.close()
+
+        archive_name = f"{user_email}_{datetime.datetime.utcnow().strftime('%Y%m%d_%H%M%S')}_{image_type}.zip"
+        return Response(
+            generate(),
+            mimetype='application/zip',
+            headers={"Content-Disposition": f'attachment; filename="{archive_name}"'}
+        )
+
+    except Exception as e:
+        print(f"Error downloading images: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/images/batch', methods=['DELETE'])
+def delete_images_batch():
+    """Delete several image records owned by a user in one operation"""
+    try:
+        payload = get_request_payload()
+        if payload is None:
+            return jsonify({"error": "Request body must be a JSON object"}), 400
+
+        user_email, error = get_request_email(payload)
+        if error:
+            return jsonify({"error": error}), 400
+
+        image_ids, error = get_request_ids(payload)
+        if error:
+            return jsonify({"error": error}), 400
+
+        if collection is None:
+            return jsonify({"error": "Database connection not available"}), 500
+
+        print(f"Attempting to delete {len(image_ids)} images for user {user_email}")
+        result = collection.delete_many({"_id": {"$in": image_ids}, "userEmail": user_email})
+        similarity_index.remove(image_ids, user_email)
+
+        print(f"Successfully deleted {result.deleted_count} images for user {user_email}")
+        return jsonify({
+            "message": f"Deleted {result.deleted_count} images",
+            "deleted_count": result.deleted_count,
+            "requested_count": len(image_ids)
+        })
+
+    except Exception as e:
+        print(f"Error deleting images: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
 if __name__ == '__main__':
     try:
         print("Initializing MongoDB connection...")
         if not init_mongodb():
             raise Exception("Failed to initialize MongoDB")
+
+        # With the debug reloader active its parent process never serves requests,
+        # so only the child builds the index; without it this process serves directly
+        if not app.debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+            print("Building similarity index...")
+            build_similarity_index()
             
         print("Loading AI models...")
         if not load_models():